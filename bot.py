@@ -1,14 +1,20 @@
 import os
+import re
+import asyncio
 import logging
+import queue
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 import yt_dlp
 import subprocess
 import tempfile
 import shutil
 import imageio_ffmpeg
 from dotenv import load_dotenv  # Add this import
-from demucs_separator import DemucsVocalSeparator  # Import the Demucs separator
+from demucs_separator import DemucsVocalSeparator, safe_name  # Import the Demucs separator
 
 # Load environment variables from .env file
 load_dotenv()  # Add this line
@@ -24,19 +30,220 @@ TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DOWNLOAD_DIR = os.path.join(BASE_DIR, "downloads")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+# Demucs weights are downloaded to TORCH_HOME; Docker points it at the /models volume
+MODELS_DIR = os.environ.setdefault("TORCH_HOME", os.path.join(BASE_DIR, "models"))
 DEFAULT_COOKIES_FILE = os.path.join(BASE_DIR, "config", "cookies.txt")
 YTDLP_COOKIES_FILE = os.environ.get("YTDLP_COOKIES_FILE", DEFAULT_COOKIES_FILE)
 YTDLP_COOKIES_FROM_BROWSER = os.environ.get("YTDLP_COOKIES_FROM_BROWSER")
 FFMPEG_LOCATION = os.environ.get("FFMPEG_LOCATION")
+WORK_DIR_ROOT = os.environ.get("WORK_DIR_ROOT", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+WORK_POOL_SIZE = int(os.environ.get("WORK_POOL_SIZE", "4"))
+OUTPUT_CACHE_MAX_GB = float(os.environ.get("OUTPUT_CACHE_MAX_GB", "10"))
+# torch.compile needs a C compiler for Inductor/Triton, which the Docker image doesn't ship
+TORCH_COMPILE = os.environ.get("TORCH_COMPILE", "0").lower() not in (
+    "0",
+    "false",
+    "no",
+)
 YTDLP_REQUIRE_COOKIES = os.environ.get("YTDLP_REQUIRE_COOKIES", "1").lower() not in (
     "0",
     "false",
     "no",
 )
 
+# Reusable per-request working directories, filled by init_work_pool()
+WORK_POOL = queue.Queue()
+_POOLED_DIRS = set()
+
+# Minimum time between progress message edits, to stay under Telegram's rate limits
+PROGRESS_MIN_INTERVAL = 2.0
+
 # Create directories if they don't exist
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(MODELS_DIR, exist_ok=True)
+
+# Shared Demucs separator, loaded once and reused across requests
+_SEPARATOR = None
+
+# Only one separation at a time: on GPU concurrent jobs would exhaust VRAM, and on
+# CPU a single job already uses every core (see DemucsVocalSeparator), so parallel
+# jobs would only oversubscribe them and each hold their own decoded audio
+GPU_SEM = asyncio.Semaphore(1)
+
+# The model is loaded, warmed up and run on this one thread. CUDA graphs recorded by
+# torch.compile are per thread, so every separation has to reuse the warm-up thread.
+GPU_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='demucs')
+
+def get_separator():
+    """Return the shared Demucs separator, loading the model on first use."""
+    global _SEPARATOR
+    if _SEPARATOR is None:
+        _SEPARATOR = DemucsVocalSeparator("htdemucs", ffmpeg=get_ffmpeg_binary(), use_compile=TORCH_COMPILE)
+    return _SEPARATOR
+
+def queue_position():
+    """Return the 1-based queue position a new job would get, or 0 if a slot is free."""
+    if not GPU_SEM.locked():
+        return 0
+    return len(GPU_SEM._waiters or ()) + 1
+
+def init_work_pool():
+    """Create the reusable working directories under WORK_DIR_ROOT.
+    
+    mkdtemp gives private (0700), unpredictably named directories, which matters in
+    a world-writable root like /dev/shm since the cookies file is copied into them.
+    """
+    for _ in range(WORK_POOL_SIZE):
+        work_dir = tempfile.mkdtemp(prefix='ytinstr_', dir=WORK_DIR_ROOT)
+        _POOLED_DIRS.add(work_dir)
+        WORK_POOL.put(work_dir)
+
+def remove_work_pool():
+    """Delete the pooled working directories on shutdown."""
+    for work_dir in _POOLED_DIRS:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    _POOLED_DIRS.clear()
+
+def acquire_work_dir():
+    """Take a working directory from the pool, or create a temporary one if it's empty."""
+    try:
+        return WORK_POOL.get_nowait()
+    except queue.Empty:
+        return tempfile.mkdtemp(prefix='ytinstr_', dir=WORK_DIR_ROOT)
+
+def release_work_dir(work_dir):
+    """Empty a pooled working directory and return it, or remove a temporary one."""
+    if work_dir in _POOLED_DIRS:
+        clear_dir(work_dir)
+        WORK_POOL.put(work_dir)
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def clear_dir(path):
+    """Delete everything inside a directory, keeping the directory itself."""
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        if os.path.isdir(entry) and not os.path.islink(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            os.remove(entry)
+
+def make_progress_callback(progress_message, loop):
+    """Build a progress callback that edits a Telegram message from a worker thread.
+    
+    Edits are handed to the event loop without waiting for them, repeated
+    percentages are dropped, and updates closer together than
+    PROGRESS_MIN_INTERVAL are skipped (except the final 100%).
+    """
+    last_time = 0.0
+    last_percent = None
+
+    def progress_callback(percent):
+        nonlocal last_time, last_percent
+        now = time.monotonic()
+        if percent == last_percent:
+            return
+        if percent != 100 and now - last_time < PROGRESS_MIN_INTERVAL:
+            return
+
+        last_time = now
+        last_percent = percent
+        asyncio.run_coroutine_threadsafe(progress_message.edit_text(f'Progress: {percent}%'), loop)
+
+    return progress_callback
+
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com')
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+
+def video_id(url):
+    """Extract the 11-character video ID from a YouTube URL, or None.
+    
+    Only youtube.com (watch and shorts) and youtu.be URLs have an ID; other sites
+    yt-dlp supports are never cached.
+    """
+    parsed = urllib.parse.urlparse(url)
+    host = (parsed.hostname or '').lower()
+    path_parts = [part for part in parsed.path.split('/') if part]
+
+    if host == 'youtu.be':
+        candidate = path_parts[0] if path_parts else None
+    elif host in YOUTUBE_HOSTS:
+        if parsed.path == '/watch':
+            candidate = urllib.parse.parse_qs(parsed.query).get('v', [None])[0]
+        elif len(path_parts) >= 2 and path_parts[0] == 'shorts':
+            candidate = path_parts[1]
+        else:
+            candidate = None
+    else:
+        candidate = None
+
+    if candidate and VIDEO_ID_RE.fullmatch(candidate):
+        return candidate
+    return None
+
+def cache_path(url, method):
+    """Return the cached instrumental path for a URL and method, or None."""
+    vid = video_id(url)
+    if not vid:
+        return None
+    return os.path.join(OUTPUT_DIR, f"{vid}_{method}.mp3")
+
+def get_cached_instrumental(url, method):
+    """Return (path, title) of a cached instrumental, or None on a cache miss."""
+    path = cache_path(url, method)
+    if not path or not os.path.exists(path):
+        return None
+
+    title_path = os.path.splitext(path)[0] + '.title'
+    try:
+        with open(title_path, encoding='utf-8') as f:
+            title = f.read().strip()
+    except OSError:
+        title = video_id(url)
+
+    # Mark as recently used for eviction; a concurrent eviction makes this a miss
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    logger.info("Using cached instrumental: %s", path)
+    return path, title
+
+def store_cached_instrumental(url, method, instrumental_file, title):
+    """Copy a finished instrumental into the cache and evict old entries."""
+    path = cache_path(url, method)
+    if not path:
+        return
+
+    try:
+        shutil.copy(instrumental_file, path)
+        with open(os.path.splitext(path)[0] + '.title', 'w', encoding='utf-8') as f:
+            f.write(title)
+        evict_cache()
+    except OSError as e:
+        logger.warning("Could not cache instrumental: %s", e)
+
+def evict_cache():
+    """Delete the least recently used cached instrumentals above OUTPUT_CACHE_MAX_GB."""
+    entries = []
+    for name in os.listdir(OUTPUT_DIR):
+        if name.endswith('.mp3'):
+            path = os.path.join(OUTPUT_DIR, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    limit = OUTPUT_CACHE_MAX_GB * 1024 ** 3
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        logger.info("Evicting cached instrumental: %s", path)
+        os.remove(path)
+        title_path = os.path.splitext(path)[0] + '.title'
+        if os.path.exists(title_path):
+            os.remove(title_path)
+        total -= size
 
 def get_ffmpeg_location():
     """Return a usable ffmpeg binary path for yt-dlp."""
@@ -49,6 +256,13 @@ def get_ffmpeg_location():
         logger.warning("Could not locate bundled ffmpeg: %s", e)
         return None
 
+def get_ffmpeg_binary():
+    """Return the ffmpeg executable to run directly for decoding/encoding."""
+    ffmpeg_binary = get_ffmpeg_location() or 'ffmpeg'
+    if os.path.isdir(ffmpeg_binary):
+        ffmpeg_binary = os.path.join(ffmpeg_binary, 'ffmpeg')
+    return ffmpeg_binary
+
 def configure_ytdlp_auth(ydl_opts, writable_dir):
     """Attach YouTube cookies to yt-dlp or fail with an actionable message."""
     if YTDLP_COOKIES_FILE and os.path.exists(YTDLP_COOKIES_FILE) and os.path.getsize(YTDLP_COOKIES_FILE) > 0:
@@ -76,9 +290,9 @@ def configure_ytdlp_auth(ydl_opts, writable_dir):
 
     logger.warning(message)
 
-def start(update: Update, context: CallbackContext) -> None:
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
-    update.message.reply_text(
+    await update.message.reply_text(
         'Hi! I can convert YouTube songs to instrumental versions.\n'
         'Just send me a YouTube URL, and I\'ll do the rest!\n\n'
         'You can also specify a vocal removal method by using one of these commands:\n'
@@ -88,9 +302,9 @@ def start(update: Update, context: CallbackContext) -> None:
         '/karaoke [URL] - Karaoke-style vocal removal'
     )
 
-def help_command(update: Update, context: CallbackContext) -> None:
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
-    update.message.reply_text(
+    await update.message.reply_text(
         'Send me a YouTube URL, and I\'ll convert it to an instrumental version by removing vocals.\n\n'
         'Available commands:\n'
         '/standard [URL] - Balanced vocal removal (default)\n'
@@ -99,85 +313,105 @@ def help_command(update: Update, context: CallbackContext) -> None:
         '/karaoke [URL] - Karaoke-style vocal removal'
     )
 
-def process_with_method(update: Update, context: CallbackContext, method='standard') -> None:
+async def process_with_method(update: Update, context: ContextTypes.DEFAULT_TYPE, method='standard') -> None:
     """Process YouTube URL with specified vocal removal method."""
     if not context.args:
-        update.message.reply_text(f'Please provide a YouTube URL after the /{method} command.')
+        await update.message.reply_text(f'Please provide a YouTube URL after the /{method} command.')
         return
     
     url = context.args[0]
     if not url.startswith(('http://', 'https://')):
-        update.message.reply_text('Please send a valid YouTube URL.')
+        await update.message.reply_text('Please send a valid YouTube URL.')
         return
     
-    update.message.reply_text(f'Processing your request using {method} vocal removal. This may take a few minutes...')
-    
     temp_dir = None
     try:
-        # Create temporary directories for processing
-        temp_dir = tempfile.mkdtemp()
-        download_path = os.path.join(temp_dir, 'audio.%(ext)s')
-        
-        # Download the audio
-        title = download_youtube_audio(url, download_path)
-        update.message.reply_text(f'Downloaded: {title}')
+        # Reuse a previously processed instrumental for the same video and method
+        cached = get_cached_instrumental(url, method)
+        if cached:
+            cached_file, title = cached
+            await update.message.reply_text('Here is your instrumental version:')
+            with open(cached_file, 'rb') as audio_file:
+                await update.message.reply_audio(
+                    audio_file,
+                    title=f"{title} (Instrumental - {method})",
+                    filename=f"{safe_name(title)} INSTRUMENTAL.mp3",
+                )
+            return
         
-        # Find the downloaded file (it will have .mp3 extension)
-        downloaded_file = os.path.join(temp_dir, 'audio.mp3')
+        await update.message.reply_text(f'Processing your request using {method} vocal removal. This may take a few minutes...')
         
-        # Process the audio to remove vocals
-        update.message.reply_text('Removing vocals...')
+        # Take a working directory for processing
+        temp_dir = acquire_work_dir()
         
-        # Create a progress callback function to update the user
-        progress_message = update.message.reply_text('Progress: 0%')
+        # Download the compressed audio. Downloads run outside the semaphore so they
+        # overlap with other jobs' inference; decoding waits for a free slot so queued
+        # requests don't each hold a full track of PCM in RAM
+        title, downloaded_file = await asyncio.to_thread(download_youtube_audio, url, temp_dir)
+        await update.message.reply_text(f'Downloaded: {title}')
         
-        def progress_callback(percent):
-            progress_message.edit_text(f'Progress: {percent}%')
+        position = queue_position()
+        if position:
+            await update.message.reply_text(f'Queued, position {position}')
         
-        instrumental_file = process_audio(downloaded_file, temp_dir, method, progress_callback, title)
+        async with GPU_SEM:
+            # Process the audio to remove vocals
+            await update.message.reply_text('Removing vocals...')
+            
+            # Create a progress callback function to update the user
+            progress_message = await update.message.reply_text('Progress: 0%')
+            
+            progress_callback = make_progress_callback(progress_message, asyncio.get_running_loop())
+            
+            instrumental_file = await asyncio.get_running_loop().run_in_executor(
+                GPU_EXECUTOR, process_audio, downloaded_file, temp_dir, method, progress_callback, title
+            )
         
         if instrumental_file and os.path.exists(instrumental_file):
             # Send the instrumental file back to the user
-            update.message.reply_text('Here is your instrumental version:')
-            with open(instrumental_file, 'rb') as audio:
-                update.message.reply_audio(audio, title=f"{title} (Instrumental - {method})")
+            await update.message.reply_text('Here is your instrumental version:')
+            with open(instrumental_file, 'rb') as audio_file:
+                await update.message.reply_audio(audio_file, title=f"{title} (Instrumental - {method})")
+            await asyncio.to_thread(store_cached_instrumental, url, method, instrumental_file, title)
         else:
-            update.message.reply_text('Sorry, there was an error processing the audio.')
+            await update.message.reply_text('Sorry, there was an error processing the audio.')
         
     except Exception as e:
         logger.error(f"Error: {e}")
-        update.message.reply_text(f'Sorry, an error occurred: {str(e)}')
+        await update.message.reply_text(f'Sorry, an error occurred: {str(e)}')
     finally:
         if temp_dir:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            release_work_dir(temp_dir)
 
-def standard_command(update: Update, context: CallbackContext) -> None:
+async def standard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process with standard vocal removal."""
-    process_with_method(update, context, 'standard')
+    await process_with_method(update, context, 'standard')
 
-def aggressive_command(update: Update, context: CallbackContext) -> None:
+async def aggressive_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process with aggressive vocal removal."""
-    process_with_method(update, context, 'aggressive')
+    await process_with_method(update, context, 'aggressive')
 
-def gentle_command(update: Update, context: CallbackContext) -> None:
+async def gentle_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process with gentle vocal removal."""
-    process_with_method(update, context, 'gentle')
+    await process_with_method(update, context, 'gentle')
 
-def karaoke_command(update: Update, context: CallbackContext) -> None:
+async def karaoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process with karaoke-style vocal removal."""
-    process_with_method(update, context, 'karaoke')
+    await process_with_method(update, context, 'karaoke')
 
-def download_youtube_audio(url, output_path):
-    """Download audio from YouTube URL."""
+def download_youtube_audio(url, work_dir):
+    """Download audio from a YouTube URL into work_dir.
+    
+    yt-dlp fetches the original compressed stream (no MP3 transcode) with its
+    own chunked, retrying downloader; the separator decodes it later.
+    Returns the video title and the path of the downloaded file.
+    """
     ydl_opts = {
         'format': 'bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '320',  # Highest MP3 quality
-        }],
-        'outtmpl': output_path,
+        'outtmpl': os.path.join(work_dir, 'audio.%(ext)s'),
         'noplaylist': True,  # Add this to prevent playlist downloads
+        'socket_timeout': 30,  # Give up on stalled connections instead of hanging
+        'quiet': True,
     }
 
     ffmpeg_location = get_ffmpeg_location()
@@ -185,12 +419,12 @@ def download_youtube_audio(url, output_path):
         ydl_opts['ffmpeg_location'] = ffmpeg_location
         logger.info("Using ffmpeg binary: %s", ffmpeg_location)
 
-    configure_ytdlp_auth(ydl_opts, os.path.dirname(output_path))
+    configure_ytdlp_auth(ydl_opts, work_dir)
     
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=True)
-            return info.get('title', 'Unknown Title')
+            downloaded_file = info['requested_downloads'][0]['filepath']
     except yt_dlp.utils.DownloadError as exc:
         error_text = str(exc)
         if (
@@ -204,91 +438,116 @@ def download_youtube_audio(url, output_path):
             ) from exc
         raise
 
-def process_audio(input_file, output_dir, method='standard', progress_callback=None, original_title=None):
+    return info.get('title', 'Unknown Title'), downloaded_file
+
+def process_audio(audio, output_dir, method='standard', progress_callback=None, original_title=None):
     """Remove vocals using Demucs for high-quality source separation."""
     try:
-        # Initialize the Demucs separator
-        separator = DemucsVocalSeparator()
+        # Reuse the shared Demucs separator
+        separator = get_separator()
         
         # Use Demucs to separate vocals from the music
-        instrumental_file = separator.separate(input_file, output_dir, method, progress_callback, original_title)
+        instrumental_file = separator.separate(audio, output_dir, method, progress_callback, original_title)
         
         return instrumental_file
     except subprocess.CalledProcessError as e:
         logger.error(f"Error processing audio: {e}")
         return None
 
-def process_youtube_url(update: Update, context: CallbackContext) -> None:
+async def process_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process YouTube URL and send back instrumental version using standard method."""
     url = update.message.text
     
     if not url.startswith(('http://', 'https://')):
-        update.message.reply_text('Please send a valid YouTube URL.')
+        await update.message.reply_text('Please send a valid YouTube URL.')
         return
     
-    update.message.reply_text('Processing your request using standard vocal removal. This may take a few minutes...')
-    
     temp_dir = None
     try:
-        # Create temporary directories for processing
-        temp_dir = tempfile.mkdtemp()
-        download_path = os.path.join(temp_dir, 'audio.%(ext)s')
+        # Reuse a previously processed instrumental for the same video and method
+        cached = get_cached_instrumental(url, 'standard')
+        if cached:
+            cached_file, title = cached
+            await update.message.reply_text('Here is your instrumental version:')
+            with open(cached_file, 'rb') as audio_file:
+                await update.message.reply_audio(
+                    audio_file,
+                    title=f"{title} (Instrumental)",
+                    filename=f"{safe_name(title)} INSTRUMENTAL.mp3",
+                )
+            return
         
-        # Download the audio
-        title = download_youtube_audio(url, download_path)
-        update.message.reply_text(f'Downloaded: {title}')
+        await update.message.reply_text('Processing your request using standard vocal removal. This may take a few minutes...')
         
-        # Find the downloaded file (it will have .mp3 extension)
-        downloaded_file = os.path.join(temp_dir, 'audio.mp3')
+        # Take a working directory for processing
+        temp_dir = acquire_work_dir()
         
-        # Process the audio to remove vocals
-        update.message.reply_text('Removing vocals...')
+        # Download the compressed audio. Downloads run outside the semaphore so they
+        # overlap with other jobs' inference; decoding waits for a free slot so queued
+        # requests don't each hold a full track of PCM in RAM
+        title, downloaded_file = await asyncio.to_thread(download_youtube_audio, url, temp_dir)
+        await update.message.reply_text(f'Downloaded: {title}')
         
-        # Create a progress callback function to update the user
-        progress_message = update.message.reply_text('Progress: 0%')
+        position = queue_position()
+        if position:
+            await update.message.reply_text(f'Queued, position {position}')
         
-        def progress_callback(percent):
-            progress_message.edit_text(f'Progress: {percent}%')
-        
-        instrumental_file = process_audio(downloaded_file, temp_dir, 'standard', progress_callback, title)
+        async with GPU_SEM:
+            # Process the audio to remove vocals
+            await update.message.reply_text('Removing vocals...')
+            
+            # Create a progress callback function to update the user
+            progress_message = await update.message.reply_text('Progress: 0%')
+            
+            progress_callback = make_progress_callback(progress_message, asyncio.get_running_loop())
+            
+            instrumental_file = await asyncio.get_running_loop().run_in_executor(
+                GPU_EXECUTOR, process_audio, downloaded_file, temp_dir, 'standard', progress_callback, title
+            )
         
         if instrumental_file and os.path.exists(instrumental_file):
             # Send the instrumental file back to the user
-            update.message.reply_text('Here is your instrumental version:')
-            with open(instrumental_file, 'rb') as audio:
-                update.message.reply_audio(audio, title=f"{title} (Instrumental)")
+            await update.message.reply_text('Here is your instrumental version:')
+            with open(instrumental_file, 'rb') as audio_file:
+                await update.message.reply_audio(audio_file, title=f"{title} (Instrumental)")
+            await asyncio.to_thread(store_cached_instrumental, url, 'standard', instrumental_file, title)
         else:
-            update.message.reply_text('Sorry, there was an error processing the audio.')
+            await update.message.reply_text('Sorry, there was an error processing the audio.')
         
     except Exception as e:
         logger.error(f"Error: {e}")
-        update.message.reply_text(f'Sorry, an error occurred: {str(e)}')
+        await update.message.reply_text(f'Sorry, an error occurred: {str(e)}')
     finally:
         if temp_dir:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            release_work_dir(temp_dir)
 
 def main() -> None:
     """Start the bot."""
-    # Create the Updater and pass it your bot's token
-    updater = Updater(TELEGRAM_TOKEN)
-
-    # Get the dispatcher to register handlers
-    dispatcher = updater.dispatcher
+    # Create the Application and pass it your bot's token.
+    # Updates are handled concurrently so a long separation doesn't block other users.
+    application = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(True).build()
 
     # on different commands - answer in Telegram
-    dispatcher.add_handler(CommandHandler("start", start))
-    dispatcher.add_handler(CommandHandler("help", help_command))
-    dispatcher.add_handler(CommandHandler("standard", standard_command))
-    dispatcher.add_handler(CommandHandler("aggressive", aggressive_command))
-    dispatcher.add_handler(CommandHandler("gentle", gentle_command))
-    dispatcher.add_handler(CommandHandler("karaoke", karaoke_command))
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("standard", standard_command))
+    application.add_handler(CommandHandler("aggressive", aggressive_command))
+    application.add_handler(CommandHandler("gentle", gentle_command))
+    application.add_handler(CommandHandler("karaoke", karaoke_command))
 
     # on non command i.e message - process YouTube URL with standard method
-    dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, process_youtube_url))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_youtube_url))
 
-    # Start the Bot
-    updater.start_polling()
-    updater.idle()
+    # Prepare the working directories and load the Demucs model up front
+    # so the first request doesn't pay for it
+    init_work_pool()
+    GPU_EXECUTOR.submit(get_separator).result()
+
+    # Run the bot until the user presses Ctrl-C
+    try:
+        application.run_polling()
+    finally:
+        remove_work_pool()
 
 if __name__ == '__main__':
     main()
@@ -1,40 +1,325 @@
 import os
+import re
+import contextlib
+import subprocess
+import numpy as np
 import torch
-import torchaudio
 from demucs.pretrained import get_model
-from demucs.apply import apply_model
+from demucs.apply import apply_model, BagOfModels
 import logging
 from tqdm import tqdm
 
 logger = logging.getLogger(__name__)
 
+# Length of the windows fed to the model, and of the crossfade between them (seconds)
+CHUNK_SECONDS = 30
+CHUNK_OVERLAP_SECONDS = 1
+
+# Sample rate and channel count expected by the Demucs models
+MODEL_SAMPLE_RATE = 44100
+MODEL_CHANNELS = 2
+
+# Per-method gains applied to the Demucs stems when building the instrumental.
+# Demucs typically outputs sources in this order: [drums, bass, other, vocals]
+MIX_COEFFS = {
+    'standard': torch.tensor([1.0, 1.0, 1.0, 0.0]),    # Balanced instrumental, all except vocals
+    'aggressive': torch.tensor([1.0, 1.0, 1.0, 0.0]),  # Completely remove vocals
+    'gentle': torch.tensor([1.0, 1.0, 1.0, 0.1]),      # Add a bit of vocals back
+    'karaoke': torch.tensor([1.2, 1.2, 0.8, 0.0]),     # Emphasize rhythm
+}
+
+def safe_name(name, max_bytes=180):
+    """Make a title usable as a filename.
+    
+    Path separators and control characters are replaced and the UTF-8 length is
+    capped, leaving room for the suffix under the 255-byte filename limit.
+    """
+    name = re.sub(r'[\\/\x00-\x1f]', '_', name)
+    name = name.encode('utf-8')[:max_bytes].decode('utf-8', errors='ignore')
+    return name.rstrip(' .') or 'audio'
+
+def decode_audio(source, ffmpeg="ffmpeg"):
+    """Decode an audio file with ffmpeg straight into memory.
+    
+    Args:
+        source (str): Path of the audio file to decode.
+        ffmpeg (str): ffmpeg binary to run.
+    
+    Returns:
+        tuple: (waveform, sample_rate), where waveform is a float32 tensor of shape
+            (channels, time) resampled to the rate the model expects.
+    """
+    cmd = [
+        ffmpeg, '-nostdin', '-loglevel', 'error',
+        '-i', source,
+        '-f', 'f32le',
+        '-ac', str(MODEL_CHANNELS),
+        '-ar', str(MODEL_SAMPLE_RATE),
+        'pipe:1',
+    ]
+    
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode the audio: {result.stderr.decode(errors='replace').strip()}")
+    
+    # ffmpeg emits interleaved frames; transpose to (channels, time)
+    samples = np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, MODEL_CHANNELS)
+    waveform = torch.from_numpy(samples.T.copy())
+    return waveform, MODEL_SAMPLE_RATE
+
+def encode_mp3(waveform, sample_rate, output_file, ffmpeg="ffmpeg"):
+    """Encode a waveform to MP3 by piping raw samples into ffmpeg's libmp3lame.
+    
+    Args:
+        waveform (torch.Tensor): float32 tensor of shape (channels, time).
+        sample_rate (int): Sample rate of the waveform.
+        output_file (str): Path of the MP3 file to write.
+        ffmpeg (str): ffmpeg binary to run.
+    """
+    channels = waveform.shape[0]
+    cmd = [
+        ffmpeg, '-nostdin', '-loglevel', 'error', '-y',
+        '-f', 'f32le',
+        '-ac', str(channels),
+        '-ar', str(sample_rate),
+        '-i', 'pipe:0',
+        '-codec:a', 'libmp3lame',
+        '-q:a', '2',
+        output_file,
+    ]
+    
+    # ffmpeg expects interleaved frames, i.e. (time, channels)
+    samples = waveform.float().t().contiguous().numpy().tobytes()
+    result = subprocess.run(cmd, input=samples, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not encode the audio: {result.stderr.decode(errors='replace').strip()}")
+
 class DemucsVocalSeparator:
     """Class for separating vocals from music using Demucs."""
     
-    def __init__(self, model_name="htdemucs"):
+    def __init__(self, model_name="htdemucs", ffmpeg="ffmpeg", use_compile=False):
         """Initialize the Demucs separator with the specified model.
         
         Args:
             model_name (str): The name of the Demucs model to use.
                 Options include: 'htdemucs' (default), 'htdemucs_ft', 'mdx_extra', etc.
+            ffmpeg (str): ffmpeg binary used to encode the output.
+            use_compile (bool): Compile the model with torch.compile. Requires a C
+                compiler, and the separator must then always be used from the thread
+                that created it, since CUDA graphs are recorded per thread.
         """
+        self.ffmpeg = ffmpeg
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Using device: {self.device}")
         
+        # On CPU use every core this process may run on (respects Docker cpusets)
+        if self.device == "cpu":
+            affinity = getattr(os, "sched_getaffinity", None)
+            num_threads = len(affinity(0)) if affinity else os.cpu_count()
+            torch.set_num_threads(num_threads)
+            logger.info(f"Using {num_threads} CPU threads")
+        
+        # Let cuDNN autotune kernels (input shapes repeat across fixed-size chunks)
+        # and allow TF32 matmuls/convolutions on Ampere+
+        if self.device == "cuda":
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        torch.set_float32_matmul_precision('high')
+        
+        # Half-precision autocast on GPU (bf16 where supported, otherwise fp16)
+        self.autocast_dtype = None
+        if self.device == "cuda":
+            self.autocast_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            logger.info(f"Using autocast dtype: {self.autocast_dtype}")
+        
         # Load the model
         try:
             self.model = get_model(model_name)
             self.model.to(self.device)
+            # Only affects the 4D weights of the spectrogram branch
+            self.model.to(memory_format=torch.channels_last)
+            self.model.eval()
             logger.info(f"Loaded Demucs model: {model_name}")
         except Exception as e:
             logger.error(f"Failed to load Demucs model: {e}")
             raise
+        
+        self.segment = self._pick_segment()
+        logger.info(f"Using segment length: {self.segment or 'model default'}")
+        
+        self.chunk_batch = self._pick_chunk_batch()
+        logger.info(f"Batching {self.chunk_batch} chunk(s) per forward pass")
+        
+        if use_compile:
+            self._compile_model()
+    
+    def _pick_segment(self):
+        """Pick an apply_model segment length (seconds) based on free VRAM.
+        
+        Returns None to keep the model's default segment length.
+        """
+        if self.device != "cuda":
+            return None
+        
+        free_bytes, _ = torch.cuda.mem_get_info()
+        free_gb = free_bytes / 1024 ** 3
+        if free_gb >= 8:
+            segment = 15
+        elif free_gb >= 4:
+            segment = 10
+        else:
+            return None
+        
+        # Transformer models (htdemucs) can't run on segments longer than they were trained on
+        max_allowed = getattr(self.model, "max_allowed_segment", float("inf"))
+        return min(segment, max_allowed)
+    
+    def _pick_chunk_batch(self):
+        """Pick how many audio chunks to run through the model at once based on free VRAM."""
+        if self.device != "cuda":
+            return 1
+        
+        free_bytes, _ = torch.cuda.mem_get_info()
+        free_gb = free_bytes / 1024 ** 3
+        if free_gb >= 8:
+            return 4
+        if free_gb >= 4:
+            return 2
+        return 1
+    
+    def _compile_model(self):
+        """Compile the model with torch.compile and warm it up.
+        
+        apply_model relies on the BagOfModels/HTDemucs classes, so each sub-model's
+        forward is compiled in place instead of wrapping the module. If compiling or
+        the warm-up run fails (e.g. no C++ compiler for the CPU backend), the eager
+        forwards are restored.
+        """
+        models = list(self.model.models) if isinstance(self.model, BagOfModels) else [self.model]
+        eager_forwards = [model.forward for model in models]
+        
+        try:
+            for model in models:
+                model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+            
+            # Warm up every batch size _apply_chunked can use (full groups of chunk_batch
+            # windows plus a smaller last group) so the first user doesn't wait for a
+            # recompile or CUDA graph re-record
+            logger.info("Compiling Demucs model")
+            for batch_size in range(1, self.chunk_batch + 1):
+                dummy = torch.zeros(batch_size, MODEL_CHANNELS, MODEL_SAMPLE_RATE * 5, device=self.device)
+                with torch.inference_mode(), self._autocast():
+                    apply_model(self.model, dummy, device=self.device, segment=self.segment, overlap=0.1, shifts=0)
+            logger.info("Compiled Demucs model")
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable, using eager model: {e}")
+            for model, forward in zip(models, eager_forwards):
+                model.forward = forward
     
-    def separate(self, input_file, output_dir, method='standard', progress_callback=None, original_title=None):
+    def _autocast(self):
+        """Return the autocast context used for model inference."""
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type="cuda", dtype=self.autocast_dtype)
+    
+    def _apply_chunked(self, waveform, sample_rate, coeffs, progress_callback=None):
+        """Run the model over overlapping windows of the waveform and mix the stems.
+        
+        Only `chunk_batch` windows are on the device at a time, batched into a single
+        apply_model call, so peak VRAM is bounded by the chunk length rather than
+        the track length. Neighbouring windows are linearly crossfaded over their
+        overlap. The stems are mixed on the device, so only the instrumental is
+        copied back to the host.
+        
+        Args:
+            waveform (torch.Tensor): CPU tensor of shape (batch, channels, time).
+            sample_rate (int): Sample rate of the waveform.
+            coeffs (torch.Tensor): Per-stem gains used to build the instrumental.
+            progress_callback (callable, optional): Called with progress between 10 and 80.
+        
+        Returns:
+            torch.Tensor: float32 CPU tensor of shape (batch, channels, time).
+        """
+        batch, channels, length = waveform.shape
+        chunk = CHUNK_SECONDS * sample_rate
+        overlap = CHUNK_OVERLAP_SECONDS * sample_rate
+        step = chunk - overlap
+        
+        windows = []
+        for start in range(0, length, step):
+            end = min(start + chunk, length)
+            windows.append((start, end))
+            if end == length:
+                break
+        
+        instrumental = torch.zeros(batch, channels, length)
+        coeffs = coeffs.to(self.device, torch.float32)
+        fade_in = torch.linspace(0, 1, overlap)
+        fade_out = 1 - fade_in
+        
+        # Several full-length windows go through the model together as one batch. Only
+        # the track's last window can be shorter; it runs on its own rather than being
+        # zero-padded, so no silence goes through the model.
+        full_windows = [window for window in windows if window[1] - window[0] == chunk]
+        groups = [
+            full_windows[first:first + self.chunk_batch]
+            for first in range(0, len(full_windows), self.chunk_batch)
+        ]
+        if len(full_windows) < len(windows):
+            groups.append([windows[-1]])
+        
+        for group in groups:
+            # Copy the windows into one contiguous buffer, pinned on CUDA so the copy to
+            # the device is an async DMA
+            width = group[0][1] - group[0][0]
+            group_waveform = torch.empty(
+                len(group) * batch, channels, width,
+                pin_memory=self.device == "cuda",
+            )
+            for i, (start, end) in enumerate(group):
+                group_waveform[i * batch:(i + 1) * batch] = waveform[..., start:end]
+            group_waveform = group_waveform.to(self.device, non_blocking=True)
+            
+            with self._autocast():
+                group_sources = apply_model(
+                    self.model,
+                    group_waveform,
+                    device=self.device,
+                    segment=self.segment,
+                    overlap=0.1,
+                    shifts=0,  # No test-time shift augmentation
+                )
+            
+            # Mix the stems in float32 on the device and only copy the mix back
+            group_mix = torch.einsum('bsct,s->bct', group_sources.float(), coeffs).cpu()
+            del group_waveform, group_sources
+            
+            for i, (start, end) in enumerate(group):
+                chunk_mix = group_mix[i * batch:(i + 1) * batch, ..., :end - start]
+                
+                # Crossfade with the previous window and fade out into the next one
+                if start > 0:
+                    chunk_mix[..., :overlap] *= fade_in
+                if end < length:
+                    chunk_mix[..., -overlap:] *= fade_out
+                instrumental[..., start:end] += chunk_mix
+            del group_mix
+            
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+            
+            if progress_callback:
+                progress_callback(10 + int(70 * group[-1][1] / length))
+        
+        return instrumental
+    
+    def separate(self, audio, output_dir, method='standard', progress_callback=None, original_title=None):
         """Separate vocals from the music file.
         
         Args:
-            input_file (str): Path to the input audio file.
+            audio (str or tuple): Path to the input audio file, or an already decoded
+                (waveform, sample_rate) pair as returned by `decode_audio`.
             output_dir (str): Directory to save the separated audio.
             method (str): Separation method ('standard', 'aggressive', 'gentle', 'karaoke').
                 This affects how the separation is performed.
@@ -50,17 +335,17 @@ class DemucsVocalSeparator:
             # Create output directory if it doesn't exist
             os.makedirs(output_dir, exist_ok=True)
             
-            # Load audio
-            logger.info(f"Loading audio file: {input_file}")
-            waveform, sample_rate = torchaudio.load(input_file)
+            # Load audio, unless it was already decoded in memory
+            if isinstance(audio, str):
+                logger.info(f"Loading audio file: {audio}")
+                waveform, sample_rate = decode_audio(audio, ffmpeg=self.ffmpeg)
+            else:
+                waveform, sample_rate = audio
             
             # Convert to expected format (batch, channels, time)
             if waveform.dim() == 2:
                 waveform = waveform.unsqueeze(0)
             
-            # Move to device
-            waveform = waveform.to(self.device)
-            
             # Apply model with progress reporting
             logger.info("Applying Demucs model for source separation")
             
@@ -68,70 +353,60 @@ class DemucsVocalSeparator:
             if progress_callback:
                 progress_callback(10)
             
-            # Apply the model
-            sources = apply_model(self.model, waveform, device=self.device)
-            
-            # Report progress after model application
-            if progress_callback:
-                progress_callback(80)
-            
-            # Move to CPU
-            sources = sources.cpu()
+            # Per-stem gains for the requested method
+            coeffs = MIX_COEFFS.get(method, MIX_COEFFS['standard'])
             
-            # Report completion
-            if progress_callback:
-                progress_callback(100)
-            else:
-                # Use tqdm for local progress display if no callback provided
-                with tqdm(total=100, desc="Processing audio", ncols=100, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}') as pbar:
-                    pbar.update(100)
-            
-            # Get the instrumental track (no vocals)
-            # Demucs typically outputs sources in this order: [drums, bass, other, vocals]
-            # We want everything except vocals for the instrumental
-            
-            # Adjust the mix based on the method
-            if method == 'aggressive':
-                # Completely remove vocals
-                instrumental = sources[:, :3].sum(dim=1)  # Sum all except vocals
-            elif method == 'gentle':
-                # Keep a small amount of vocals
-                instrumental = sources[:, :3].sum(dim=1) + 0.1 * sources[:, 3]  # Add a bit of vocals back
-            elif method == 'karaoke':
-                # Focus on drums and bass, reduce other elements
-                instrumental = 1.2 * sources[:, 0] + 1.2 * sources[:, 1] + 0.8 * sources[:, 2]  # Emphasize rhythm
-            else:  # standard
-                # Balanced instrumental
-                instrumental = sources[:, :3].sum(dim=1)  # Sum all except vocals
+            # Run the model and the stem mix without autograd bookkeeping
+            with torch.inference_mode():
+                # Apply the model chunk by chunk; each chunk is mixed on the device and
+                # the instrumental comes back as float32 on the CPU
+                instrumental = self._apply_chunked(waveform, sample_rate, coeffs, progress_callback)
+                
+                # Report completion
+                if progress_callback:
+                    progress_callback(100)
+                else:
+                    # Use tqdm for local progress display if no callback provided
+                    with tqdm(total=100, desc="Processing audio", ncols=100, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}') as pbar:
+                        pbar.update(100)
             
             # Generate output file path with INSTRUMENTAL suffix
             if original_title:
                 # Use the original YouTube video title if provided
-                # Preserve the exact YouTube title and add INSTRUMENTAL suffix
-                base_name = original_title
-            else:
+                # Keep the YouTube title as-is apart from characters that can't be in a filename
+                base_name = safe_name(original_title)
+            elif isinstance(audio, str):
                 # Fallback to the input filename if no original title is provided
-                base_name = os.path.splitext(os.path.basename(input_file))[0]
+                base_name = os.path.splitext(os.path.basename(audio))[0]
+            else:
+                base_name = "audio"
                 
-            # Ensure we use the exact YouTube title with INSTRUMENTAL suffix
-            # The filename should be exactly the same as the YouTube title with INSTRUMENTAL suffix
-            # No sanitization or modification of the original title
-            # Use the raw YouTube title and just append INSTRUMENTAL suffix
+            # The filename is the YouTube title with the INSTRUMENTAL suffix appended.
+            # Only path separators and control characters are replaced, and very long
+            # titles are truncated, so the file can always be written
             instrumental_file = os.path.join(output_dir, f"{base_name} INSTRUMENTAL.mp3")
             logger.info(f"Output filename: {instrumental_file}")
             logger.info(f"Using title for output: {base_name}")
             
             # Save the instrumental track
             logger.info(f"Saving instrumental to: {instrumental_file}")
-            torchaudio.save(
-                instrumental_file,
+            encode_mp3(
                 instrumental.squeeze(0),  # Remove batch dimension
                 sample_rate,
-                format="mp3"  # MP3 format without compression parameter
+                instrumental_file,
+                ffmpeg=self.ffmpeg,
             )
             
+            # Drop the large tensors before returning instead of at frame teardown
+            del waveform, instrumental
+            
             return instrumental_file
             
         except Exception as e:
             logger.error(f"Error in Demucs separation: {e}")
             return None
+        finally:
+            # Hand cached GPU blocks back even if separation failed midway (e.g. OOM)
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+                torch.cuda.ipc_collect()